@@ -659,6 +659,30 @@ export default function Home() {
                       {translateRiskLevel(safeState.spamRiskResult.level)}
                     </span>
                   </div>
+                  {safeState.spamRiskResult.worstChunk !== undefined &&
+                    safeState.spamRiskResult.chunks &&
+                    (safeState.spamRiskResult.partial ? (
+                      <p className="py-1 text-gray-500">
+                        Text was checked in{" "}
+                        {safeState.spamRiskResult.chunks.length} parts,{" "}
+                        {
+                          safeState.spamRiskResult.chunks.filter(
+                            (chunk) => !chunk.success
+                          ).length
+                        }{" "}
+                        of which could not be checked. Score and details below
+                        are for part {safeState.spamRiskResult.worstChunk + 1},
+                        the highest of the checked parts, and the actual risk
+                        may be higher.
+                      </p>
+                    ) : (
+                      <p className="py-1 text-gray-500">
+                        Text was checked in{" "}
+                        {safeState.spamRiskResult.chunks.length} parts. Score
+                        and details below are for part{" "}
+                        {safeState.spamRiskResult.worstChunk + 1}, the riskiest.
+                      </p>
+                    ))}
                   {safeState.spamRiskResult.details?.map((detail, idx) =>
                     detail.params.map((param, paramIdx) => (
                       <div
@@ -11,12 +11,41 @@ export interface KeywordPhrase {
   timesUsed: number;
 }
 
+export interface KeywordDensityWindow {
+  keyword: string;
+  densities: number[];
+  maxDensity: number;
+  maxWindowStart: number;
+  maxWindowCharStart: number;
+  maxWindowCharEnd: number;
+}
+
+export interface DensityWindows {
+  windowSize: number;
+  step: number;
+  windowStarts: number[];
+  keywords: KeywordDensityWindow[];
+}
+
 export interface AnalysisResult {
   singleKeywords: SingleKeyword[];
   stopwords: SingleKeyword[];
   phrases: KeywordPhrase[];
   totalWords: number;
   uniqueWords: number;
+  densityWindows?: DensityWindows;
+}
+
+export interface SpamRiskChunk {
+  index: number;
+  start: number;
+  end: number;
+  success: boolean;
+  risk?: number;
+  level?: string;
+  details?: SpamRiskResult["details"];
+  link?: string;
+  error?: string;
 }
 
 export interface SpamRiskResult {
@@ -31,6 +60,9 @@ export interface SpamRiskResult {
       score: number;
     }>;
   }>;
+  worstChunk?: number;
+  partial?: boolean;
+  chunks?: SpamRiskChunk[];
 }
 
 export interface AppState {
@@ -0,0 +1,391 @@
+"""
+Load-test harness for the HTTP handlers in main.py.
+
+Drives analyze_text, check_spam_risk, save_analysis and get_analysis in
+process at a configurable concurrency and request mix. Firestore is replaced
+with an in-memory store and the spam API with a local HTTP stub whose latency
+and error rate can be tuned, so runs are repeatable and need no credentials.
+
+Usage:
+    python loadtest.py --requests 2000 --concurrency 16 --output loadtest.json
+"""
+import argparse
+import copy
+import gzip
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from flask import Request
+from werkzeug.test import EnvironBuilder
+
+DEFAULT_MIX = "analyze_text=4,check_spam_risk=2,save_analysis=1,get_analysis=3"
+ENDPOINTS = ("analyze_text", "check_spam_risk", "save_analysis", "get_analysis")
+
+
+class InMemorySnapshot:
+    """Document snapshot returned by InMemoryDocument.get()."""
+
+    def __init__(self, data):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data)
+
+
+class InMemoryDocument:
+    """Document reference backed by a shared dict."""
+
+    def __init__(self, store, key):
+        self._store = store
+        self._key = key
+
+    def set(self, data):
+        with self._store.lock:
+            self._store.documents[self._key] = copy.deepcopy(data)
+
+    def get(self):
+        with self._store.lock:
+            return InMemorySnapshot(copy.deepcopy(self._store.documents.get(self._key)))
+
+
+class InMemoryCollection:
+    """Collection reference for InMemoryFirestore."""
+
+    def __init__(self, store, name):
+        self._store = store
+        self._name = name
+
+    def document(self, document_id):
+        return InMemoryDocument(self._store, (self._name, document_id))
+
+
+class InMemoryFirestore:
+    """Thread-safe stand-in for the subset of the Firestore client used by main."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.documents = {}
+
+    def collection(self, name):
+        return InMemoryCollection(self, name)
+
+
+class SpamApiStub:
+    """Local HTTP server imitating the spam API with injectable latency and errors."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None, max_url_length=8192):
+        self.latency_ms = latency_ms
+        self.max_url_length = max_url_length
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.calls = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}/"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with stub.random_lock:
+                    stub.calls += 1
+                    delay = stub.latency_ms + stub.random.uniform(0, stub.jitter_ms)
+                    failed = stub.random.random() < stub.error_rate
+                time.sleep(delay / 1000)
+
+                if len(self.path) > stub.max_url_length:
+                    status, body = 414, b"URI Too Long"
+                elif failed:
+                    status, body = 500, b"Internal Server Error"
+                else:
+                    status = 200
+                    body = json.dumps({
+                        "risk": 3,
+                        "level": "низкий",
+                        "details": [],
+                        "link": "stub"
+                    }).encode("utf-8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_main():
+    """Import main without touching real Firebase credentials."""
+    if "main" in sys.modules:
+        return sys.modules["main"]
+    with patch("firebase_admin.initialize_app"), patch("firebase_admin.firestore.client"):
+        import main
+    return main
+
+
+def parse_mix(mix):
+    """Parse 'name=weight,...' into a dict of endpoint weights."""
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.strip().partition("=")
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        weights[name] = float(weight or 1)
+    if not any(weights.values()):
+        raise ValueError("Mix must have at least one positive weight")
+    return weights
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def build_request(method, body=None, query=None, accept_encoding=None):
+    """Build a flask Request the way the functions runtime passes it to a handler."""
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+    builder = EnvironBuilder(method=method, json=body, query_string=query, headers=headers)
+    try:
+        return Request(builder.get_environ())
+    finally:
+        builder.close()
+
+
+def decode_body(response):
+    """Return the parsed JSON body of a handler response."""
+    data = response.get_data()
+    encoding = response.headers.get("Content-Encoding")
+    if encoding == "gzip":
+        data = gzip.decompress(data)
+    elif encoding == "br":
+        import brotli
+        data = brotli.decompress(data)
+    return json.loads(data) if data else None
+
+
+class LoadTest:
+    """Runs a request mix against the handlers and collects per-endpoint metrics."""
+
+    def __init__(self, main, text, weights, total_requests, concurrency, accept_encoding=None, seed=None,
+                 spam_chunked=False):
+        self.main = main
+        self.text = text
+        self.weights = weights
+        self.total_requests = total_requests
+        self.concurrency = concurrency
+        self.accept_encoding = accept_encoding
+        self.spam_chunked = spam_chunked
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.saved_ids = []
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.errors = Counter()
+        self.status_codes = {name: Counter() for name in ENDPOINTS}
+        self.analysis_result = main.analyze_text_logic(text)
+
+    def call(self, endpoint):
+        """Send one request to an endpoint, returning (status, is_error)."""
+        if endpoint == "get_analysis":
+            with self.lock:
+                analysis_id = self.random.choice(self.saved_ids)
+            req = build_request("GET", query={"id": analysis_id}, accept_encoding=self.accept_encoding)
+        elif endpoint == "save_analysis":
+            body = {"text": self.text, "analysisResult": self.analysis_result, "spamRiskResult": None}
+            req = build_request("POST", body=body, accept_encoding=self.accept_encoding)
+        elif endpoint == "check_spam_risk":
+            body = {"text": self.text, "chunked": self.spam_chunked}
+            req = build_request("POST", body=body, accept_encoding=self.accept_encoding)
+        else:
+            req = build_request("POST", body={"text": self.text}, accept_encoding=self.accept_encoding)
+
+        response = getattr(self.main, endpoint)(req)
+        payload = decode_body(response)
+
+        if endpoint == "save_analysis" and response.status_code == 200:
+            with self.lock:
+                self.saved_ids.append(payload["id"])
+        if endpoint == "check_spam_risk" and response.status_code == 200:
+            return response.status_code, not payload.get("success")
+        return response.status_code, response.status_code >= 400
+
+    def timed_call(self, endpoint):
+        start = time.perf_counter()
+        try:
+            status, failed = self.call(endpoint)
+        except Exception:
+            status, failed = "exception", True
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self.lock:
+            self.latencies[endpoint].append(elapsed_ms)
+            self.status_codes[endpoint][str(status)] += 1
+            if failed:
+                self.errors[endpoint] += 1
+
+    def run(self):
+        """Execute the configured mix and return the report dict."""
+        # Seed one saved analysis so get_analysis has something to read
+        self.call("save_analysis")
+
+        names = list(self.weights)
+        plan = self.random.choices(names, weights=[self.weights[n] for n in names], k=self.total_requests)
+
+        started_at = datetime.now(timezone.utc)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            list(executor.map(self.timed_call, plan))
+        duration = time.perf_counter() - start
+
+        return self.report(started_at, duration)
+
+    def report(self, started_at, duration):
+        endpoints = {}
+        for name in ENDPOINTS:
+            latencies = self.latencies[name]
+            if not latencies:
+                continue
+            count = len(latencies)
+            endpoints[name] = {
+                "requests": count,
+                "errors": self.errors[name],
+                "errorRate": round(self.errors[name] / count, 4),
+                "throughput": round(count / duration, 2),
+                "latencyMs": {
+                    "min": round(min(latencies), 2),
+                    "mean": round(sum(latencies) / count, 2),
+                    "p50": round(percentile(latencies, 50), 2),
+                    "p95": round(percentile(latencies, 95), 2),
+                    "p99": round(percentile(latencies, 99), 2),
+                    "max": round(max(latencies), 2)
+                },
+                "statusCodes": dict(self.status_codes[name])
+            }
+
+        total_errors = sum(self.errors.values())
+        return {
+            "startedAt": started_at.isoformat(),
+            "durationSeconds": round(duration, 3),
+            "totals": {
+                "requests": self.total_requests,
+                "errors": total_errors,
+                "errorRate": round(total_errors / self.total_requests, 4) if self.total_requests else 0.0,
+                "throughput": round(self.total_requests / duration, 2) if duration else 0.0
+            },
+            "endpoints": endpoints
+        }
+
+
+def run_load_test(text, mix=DEFAULT_MIX, total_requests=1000, concurrency=8, spam_latency_ms=200.0,
+                  spam_jitter_ms=100.0, spam_error_rate=0.0, accept_encoding="gzip, br", seed=None,
+                  spam_chunked=False):
+    """Run a load test against local stand-ins and return the report dict."""
+    main = load_main()
+    weights = parse_mix(mix)
+    config = {
+        "mix": weights,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "textLength": len(text),
+        "spamLatencyMs": spam_latency_ms,
+        "spamJitterMs": spam_jitter_ms,
+        "spamErrorRate": spam_error_rate,
+        "spamChunked": spam_chunked,
+        "acceptEncoding": accept_encoding,
+        "seed": seed
+    }
+
+    with SpamApiStub(spam_latency_ms, spam_jitter_ms, spam_error_rate, seed) as stub, \
+            patch.object(main, "db", InMemoryFirestore()), \
+            patch.object(main, "SPAM_API_URL", stub.url), \
+            patch.dict(os.environ, {"TURGENEV_API_KEY": "loadtest"}):
+        report = LoadTest(
+            main, text, weights, total_requests, concurrency, accept_encoding, seed, spam_chunked
+        ).run()
+        report["spamApiCalls"] = stub.calls
+
+    report["config"] = config
+    return report
+
+
+def cli():
+    parser = argparse.ArgumentParser(description="Load-test the analysis handlers against local stand-ins.")
+    parser.add_argument("--text-file", default=os.path.join(os.path.dirname(__file__), "example.txt"))
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Endpoint weights, e.g. analyze_text=4,get_analysis=1")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--spam-latency-ms", type=float, default=200.0)
+    parser.add_argument("--spam-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--spam-error-rate", type=float, default=0.0)
+    parser.add_argument("--spam-chunked", action="store_true", help="Score spam risk in concurrent chunks")
+    parser.add_argument("--accept-encoding", default="gzip, br")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default="loadtest.json")
+    args = parser.parse_args()
+
+    with open(args.text_file, encoding="utf-8") as f:
+        text = f.read()
+
+    report = run_load_test(
+        text,
+        mix=args.mix,
+        total_requests=args.requests,
+        concurrency=args.concurrency,
+        spam_latency_ms=args.spam_latency_ms,
+        spam_jitter_ms=args.spam_jitter_ms,
+        spam_error_rate=args.spam_error_rate,
+        accept_encoding=args.accept_encoding,
+        seed=args.seed,
+        spam_chunked=args.spam_chunked
+    )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    for name, stats in report["endpoints"].items():
+        latency = stats["latencyMs"]
+        print(
+            f"{name:<16} {stats['requests']:>6} req  {stats['throughput']:>8.1f} req/s  "
+            f"p50 {latency['p50']:>8.1f} ms  p95 {latency['p95']:>8.1f} ms  "
+            f"p99 {latency['p99']:>8.1f} ms  errors {stats['errorRate']:.2%}"
+        )
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    cli()
@@ -5,7 +5,14 @@ from firebase_admin import initialize_app, firestore
 import json
 import re
 import os
+import gzip
+import heapq
+import threading
+import time
+import urllib.parse
+from bisect import bisect_right
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import nltk
 from nltk.corpus import stopwords
 from nltk.util import ngrams
@@ -13,17 +20,127 @@ from nltk.stem import PorterStemmer
 import requests
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
 initialize_app()
 db = firestore.client()
 
 DEFAULT_REGION = "europe-west3"
 
+SPAM_API_URL = os.environ.get("SPAM_API_URL", "https://turgenev.ashmanov.com/")
+# Chunk size bound, not a known API limit: keeps each chunk's URL well under
+# the common 8 KB request-line limit of HTTP servers and proxies
+SPAM_MAX_ENCODED_LENGTH = 6000
+SPAM_CHUNK_CONCURRENCY = 8
+SPAM_REQUESTS_PER_SECOND = 20
+
+DENSITY_WINDOW_KEYWORDS = 10
+MIN_WINDOW_SIZE = 10
+MAX_WINDOW_SIZE = 1000
+
+MIN_COMPRESS_SIZE = 1024
+MAX_RESULT_LIMIT = 1000
+ANALYSIS_FIELDS = ("singleKeywords", "stopwords", "phrases", "totalWords", "uniqueWords", "densityWindows")
+KEYWORD_COLUMNS = ("keyword", "density", "timesUsed", "isStopword", "isOverFrequent")
+PHRASE_COLUMNS = ("phrase", "timesUsed")
+DENSITY_WINDOW_COLUMNS = (
+    "keyword", "densities", "maxDensity", "maxWindowStart", "maxWindowCharStart", "maxWindowCharEnd"
+)
+
 try:
     nltk.data.find('corpora/stopwords')
 except LookupError:
     nltk.download('stopwords', quiet=True)
 
 
+def dumps(payload):
+    """Serialize payload to JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick br or gzip from an Accept-Encoding header, or None for identity."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    def quality_of(name):
+        return accepted.get(name, accepted.get("*", 0.0))
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=quality_of)
+    return best if quality_of(best) > 0 else None
+
+
+def json_response(req, payload, status, headers):
+    """Build a JSON response, compressed when the client accepts it."""
+    body = dumps(payload)
+    headers = dict(headers)
+    headers["Vary"] = "Accept-Encoding"
+
+    if len(body) >= MIN_COMPRESS_SIZE:
+        encoding = negotiate_encoding(req.headers.get("Accept-Encoding"))
+        if encoding == "br":
+            body = brotli.compress(body, quality=4)
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=5)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+
+    return https_fn.Response(body, status=status, headers=headers)
+
+
+def top_counts(counts, limit=None):
+    """Return (item, count) pairs by descending count, partially selected when limited."""
+    if limit is None:
+        return sorted(counts, key=lambda x: x[1], reverse=True)
+    return heapq.nlargest(limit, counts, key=lambda x: x[1])
+
+
+def to_columnar(rows, columns):
+    """Convert a list of objects into parallel arrays keyed by column."""
+    return {column: [row[column] for row in rows] for column in columns}
+
+
+def shape_analysis_result(result, fields=None, shape="objects"):
+    """Select requested fields and optionally convert lists to columnar form."""
+    if fields is not None:
+        result = {key: value for key, value in result.items() if key in fields}
+
+    if shape == "columnar":
+        result = dict(result)
+        for key in ("singleKeywords", "stopwords"):
+            if key in result:
+                result[key] = to_columnar(result[key], KEYWORD_COLUMNS)
+        if "phrases" in result:
+            result["phrases"] = to_columnar(result["phrases"], PHRASE_COLUMNS)
+        if "densityWindows" in result:
+            windows = dict(result["densityWindows"])
+            windows["keywords"] = to_columnar(windows["keywords"], DENSITY_WINDOW_COLUMNS)
+            result["densityWindows"] = windows
+
+    return result
+
+
 def detect_overfrequent_words(word_counts, total_words):
     """
     Detect words that appear significantly more than expected by Zipf's law.
@@ -61,10 +178,81 @@ def detect_overfrequent_words(word_counts, total_words):
     return overfrequent
 
 
-def analyze_text_logic(text, language='english'):
+def original_spans(text, text_lower, spans):
+    """
+    Map (start, end) offsets in text.lower() back to offsets in text.
+
+    Lowercasing can lengthen some characters (e.g. 'İ'), which shifts offsets.
+    """
+    if len(text_lower) == len(text):
+        return spans
+    origin = [index for index, char in enumerate(text) for _ in char.lower()]
+    return [(origin[start], origin[end - 1] + 1) for start, end in spans]
+
+
+def compute_density_windows(stems, spans, keywords, window_size):
+    """
+    Compute keyword density over a sliding window of tokens.
+
+    Uses rolling counters so each token is added and removed once, making the
+    whole profile a single O(n) pass regardless of window size. Densities are
+    sampled every half window to keep the arrays compact, while the densest
+    window is tracked over every position.
+
+    keywords is a list of (stem, display_keyword) pairs. stems holds one entry
+    per token, with None for tokens that should not count towards any keyword.
+    spans holds the (start, end) character offsets of each token.
+    """
+    total = len(stems)
+    window_size = min(window_size, total)
+    step = max(window_size // 2, 1)
+
+    counts = {stem: 0 for stem, _ in keywords}
+    peak_count = dict(counts)
+    peak_start = dict(counts)
+    samples = {stem: [] for stem in counts}
+    starts = []
+
+    for i, stem in enumerate(stems):
+        start = i - window_size + 1
+        if start > 0:
+            leaving = stems[start - 1]
+            if leaving in counts:
+                counts[leaving] -= 1
+        if stem in counts:
+            counts[stem] += 1
+            # A window max can only move when a keyword enters it
+            if counts[stem] > peak_count[stem]:
+                peak_count[stem] = counts[stem]
+                peak_start[stem] = max(start, 0)
+        if start >= 0 and (start % step == 0 or i == total - 1):
+            starts.append(start)
+            for tracked, count in counts.items():
+                samples[tracked].append(round((count / window_size) * 100, 2))
+
+    return {
+        "windowSize": window_size,
+        "step": step,
+        "windowStarts": starts,
+        "keywords": [
+            {
+                "keyword": keyword,
+                "densities": samples[stem],
+                "maxDensity": round((peak_count[stem] / window_size) * 100, 2),
+                "maxWindowStart": peak_start[stem],
+                "maxWindowCharStart": spans[peak_start[stem]][0],
+                "maxWindowCharEnd": spans[peak_start[stem] + window_size - 1][1]
+            }
+            for stem, keyword in keywords
+        ]
+    }
+
+
+def analyze_text_logic(text, language='english', window_size=None, limit=None):
     """Analyze text for keyword density and repeated phrases."""
     text_lower = text.lower()
-    words = re.findall(r'\b[a-z]+\b', text_lower)
+    matches = list(re.finditer(r'\b[a-z]+\b', text_lower))
+    words = [match.group() for match in matches]
     total_words = len(words)
 
     if total_words == 0:
@@ -83,6 +271,7 @@ def analyze_text_logic(text, language='english'):
     stopword_stems = []
     stem_to_original = {}
     all_stems = []
+    keyword_tokens = []
     stem_is_stopword = {}
     
     for word in words:
@@ -93,8 +282,11 @@ def analyze_text_logic(text, language='english'):
         
         if is_stop:
             stopword_stems.append(stemmed)
+            # Stopwords can share a stem with a keyword ("will" vs "willing")
+            keyword_tokens.append(None)
         else:
             meaningful_stems.append(stemmed)
+            keyword_tokens.append(stemmed)
         
         if stemmed not in stem_to_original or len(word) < len(stem_to_original[stemmed]):
             stem_to_original[stemmed] = word
@@ -112,6 +304,13 @@ def analyze_text_logic(text, language='english'):
         if not stem_is_stopword.get(bigram[0], True) and not stem_is_stopword.get(bigram[1], True)
     )
 
+    keyword_candidates = [
+        (stem, count)
+        for stem, count in word_counts.items()
+        if count >= 2 and round((count / total_words) * 100, 2) >= 0.8
+    ]
+    keyword_stems = top_counts(keyword_candidates, limit)
+
     single_keywords = [
         {
             "keyword": stem_to_original.get(stem, stem),
@@ -120,8 +319,7 @@ def analyze_text_logic(text, language='english'):
             "isStopword": False,
             "isOverFrequent": stem in overfrequent_words
         }
-        for stem, count in sorted(word_counts.items(), key=lambda x: x[1], reverse=True)
-        if count >= 2 and round((count / total_words) * 100, 2) >= 0.8
+        for stem, count in keyword_stems
     ]
     
     stopwords_list = [
@@ -132,8 +330,14 @@ def analyze_text_logic(text, language='english'):
             "isStopword": True,
             "isOverFrequent": False
         }
-        for stem, count in sorted(stopword_counts.items(), key=lambda x: x[1], reverse=True)
-        if count >= 2 and round((count / total_words) * 100, 2) >= 0.8
+        for stem, count in top_counts(
+            (
+                (stem, count)
+                for stem, count in stopword_counts.items()
+                if count >= 2 and round((count / total_words) * 100, 2) >= 0.8
+            ),
+            limit
+        )
     ]
 
     phrases = [
@@ -141,11 +345,13 @@ def analyze_text_logic(text, language='english'):
             "phrase": " ".join([stem_to_original.get(stem, stem) for stem in phrase]),
             "timesUsed": count
         }
-        for phrase, count in sorted(bigrams.items(), key=lambda x: x[1], reverse=True)
-        if count >= 2
+        for phrase, count in top_counts(
+            ((phrase, count) for phrase, count in bigrams.items() if count >= 2),
+            limit
+        )
     ]
 
-    return {
+    result = {
         "singleKeywords": single_keywords,
         "stopwords": stopwords_list,
         "phrases": phrases,
@@ -153,13 +359,50 @@ def analyze_text_logic(text, language='english'):
         "uniqueWords": len(word_counts)
     }
 
+    if window_size:
+        spans = original_spans(text, text_lower, [match.span() for match in matches])
+        top_keywords = [
+            (stem, stem_to_original.get(stem, stem))
+            for stem, _ in top_counts(keyword_candidates, DENSITY_WINDOW_KEYWORDS)
+        ]
+        result["densityWindows"] = compute_density_windows(
+            keyword_tokens, spans, top_keywords, window_size
+        )
+
+    return result
+
+
+class RateLimiter:
+    """
+    Space out call starts to at most rate calls per second across threads.
+
+    Shared by every request on the instance, so concurrent checks queue for
+    the same budget of outbound spam API calls.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+spam_rate_limiter = RateLimiter(SPAM_REQUESTS_PER_SECOND)
+
 
 def get_spam_risk_score(text, api_key):
     """Call spam detection API to get risk score."""
     try:
-        import urllib.parse
         encoded_text = urllib.parse.quote(text)
-        url = f"https://turgenev.ashmanov.com/?api=risk&key={api_key}&more=1&text={encoded_text}"
+        spam_rate_limiter.wait()
+        url = f"{SPAM_API_URL}?api=risk&key={api_key}&more=1&text={encoded_text}"
         response = requests.get(url, timeout=30)
         
         if response.status_code == 200:
@@ -180,7 +423,8 @@ def get_spam_risk_score(text, api_key):
         else:
             return {
                 "success": False,
-                "error": f"API returned status code {response.status_code}: {response.text}"
+                "error": f"API returned status code {response.status_code}: {response.text}",
+                "statusCode": response.status_code
             }
     except Exception as e:
         return {
@@ -189,6 +433,100 @@ def get_spam_risk_score(text, api_key):
         }
 
 
+def encoded_length(text):
+    """Length of text once URL-encoded for the spam API query string."""
+    return len(urllib.parse.quote(text))
+
+
+def split_text_chunks(text, max_encoded_length=SPAM_MAX_ENCODED_LENGTH):
+    """
+    Split text into chunks that each stay within max_encoded_length when URL-encoded.
+
+    Cuts at the last paragraph or sentence boundary that fits, falling back to
+    whitespace and then to a hard cut for very long sentences.
+    Returns a list of (start, end) character offsets into text.
+    """
+    cumulative = [0]
+    for char in text:
+        cumulative.append(cumulative[-1] + encoded_length(char))
+
+    sentence_ends = [m.end() for m in re.finditer(r'\n\s*|[.!?]+\s+', text)]
+    space_ends = [m.end() for m in re.finditer(r'\s+', text)]
+
+    spans = []
+    start = 0
+    while start < len(text):
+        limit = bisect_right(cumulative, cumulative[start] + max_encoded_length) - 1
+        if limit >= len(text):
+            end = len(text)
+        else:
+            end = max(limit, start + 1)
+            for boundaries in (sentence_ends, space_ends):
+                index = bisect_right(boundaries, limit) - 1
+                if index >= 0 and boundaries[index] > start:
+                    end = boundaries[index]
+                    break
+        spans.append((start, end))
+        start = end
+
+    return spans
+
+
+def get_chunked_spam_risk_score(text, api_key):
+    """
+    Score long text in bounded chunks concurrently and combine the results.
+
+    The combined risk is the highest chunk risk, since that is where stuffing
+    is concentrated. Top-level details and link describe only that chunk,
+    whose index is worstChunk; every chunk keeps its own offsets, scores,
+    details and link in chunks.
+    """
+    spans = [
+        (start, end) for start, end in split_text_chunks(text)
+        if text[start:end].strip()
+    ]
+    if not spans:
+        return get_spam_risk_score(text, api_key)
+
+    def score(span):
+        return get_spam_risk_score(text[span[0]:span[1]], api_key)
+
+    with ThreadPoolExecutor(max_workers=min(SPAM_CHUNK_CONCURRENCY, len(spans))) as executor:
+        results = list(executor.map(score, spans))
+
+    chunks = []
+    for index, ((start, end), result) in enumerate(zip(spans, results)):
+        chunk = {"index": index, "start": start, "end": end, "success": result["success"]}
+        if result["success"]:
+            chunk["risk"] = result["risk"]
+            chunk["level"] = result["level"]
+            chunk["details"] = result["details"]
+            chunk["link"] = result["link"]
+        else:
+            chunk["error"] = result["error"]
+        chunks.append(chunk)
+
+    scored = [chunk for chunk in chunks if chunk["success"]]
+    if not scored:
+        return {
+            "success": False,
+            "error": chunks[0]["error"],
+            "chunks": chunks
+        }
+
+    worst = max(scored, key=lambda chunk: chunk["risk"])
+    return {
+        "success": True,
+        "risk": worst["risk"],
+        "level": worst["level"],
+        "details": worst["details"],
+        "link": worst["link"],
+        "worstChunk": worst["index"],
+        "partial": len(scored) < len(chunks),
+        "chunks": chunks
+    }
+
+
 @https_fn.on_request(region=DEFAULT_REGION)
 def analyze_text(req: https_fn.Request) -> https_fn.Response:
     """Analyze text for keyword density and repeated phrases."""
@@ -204,15 +542,17 @@ def analyze_text(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response("", status=204, headers=cors_headers)
 
     if req.method != "POST":
-        return https_fn.Response(
-            json.dumps({"error": "Method not allowed"}),
+        return json_response(
+            req,
+            {"error": "Method not allowed"},
             status=405,
             headers=cors_headers
         )
 
     if not req.get_data():
-        return https_fn.Response(
-            json.dumps({"error": "No data provided"}),
+        return json_response(
+            req,
+            {"error": "No data provided"},
             status=400,
             headers=cors_headers
         )
@@ -222,30 +562,82 @@ def analyze_text(req: https_fn.Request) -> https_fn.Response:
         text = data.get("text", "")
 
         if not text or not text.strip():
-            return https_fn.Response(
-                json.dumps({"error": "Text is required"}),
+            return json_response(
+                req,
+                {"error": "Text is required"},
                 status=400,
                 headers=cors_headers
             )
 
         if len(text) > 50000:
-            return https_fn.Response(
-                json.dumps({"error": "Text exceeds maximum length of 50000 characters"}),
+            return json_response(
+                req,
+                {"error": "Text exceeds maximum length of 50000 characters"},
                 status=400,
                 headers=cors_headers
             )
 
-        result = analyze_text_logic(text)
+        window_size = data.get("windowSize")
+        if window_size is not None and (
+            not isinstance(window_size, int)
+            or isinstance(window_size, bool)
+            or not MIN_WINDOW_SIZE <= window_size <= MAX_WINDOW_SIZE
+        ):
+            return json_response(
+                req,
+                {"error": f"windowSize must be an integer between {MIN_WINDOW_SIZE} and {MAX_WINDOW_SIZE}"},
+                status=400,
+                headers=cors_headers
+            )
+
+        limit = data.get("limit")
+        if limit is not None and (
+            not isinstance(limit, int)
+            or isinstance(limit, bool)
+            or not 1 <= limit <= MAX_RESULT_LIMIT
+        ):
+            return json_response(
+                req,
+                {"error": f"limit must be an integer between 1 and {MAX_RESULT_LIMIT}"},
+                status=400,
+                headers=cors_headers
+            )
 
-        return https_fn.Response(
-            json.dumps(result),
+        fields = data.get("fields")
+        if fields is not None and (
+            not isinstance(fields, list)
+            or not all(field in ANALYSIS_FIELDS for field in fields)
+        ):
+            return json_response(
+                req,
+                {"error": f"fields must be a list of: {', '.join(ANALYSIS_FIELDS)}"},
+                status=400,
+                headers=cors_headers
+            )
+
+        shape = data.get("shape", "objects")
+        if shape not in ("objects", "columnar"):
+            return json_response(
+                req,
+                {"error": "shape must be objects or columnar"},
+                status=400,
+                headers=cors_headers
+            )
+
+        result = analyze_text_logic(text, window_size=window_size, limit=limit)
+        result = shape_analysis_result(result, fields, shape)
+
+        return json_response(
+            req,
+            result,
             status=200,
             headers=cors_headers
         )
 
     except Exception as e:
-        return https_fn.Response(
-            json.dumps({"error": str(e)}),
+        return json_response(
+            req,
+            {"error": str(e)},
             status=500,
             headers=cors_headers
         )
@@ -266,15 +658,17 @@ def check_spam_risk(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response("", status=204, headers=cors_headers)
 
     if req.method != "POST":
-        return https_fn.Response(
-            json.dumps({"error": "Method not allowed"}),
+        return json_response(
+            req,
+            {"error": "Method not allowed"},
             status=405,
             headers=cors_headers
         )
 
     if not req.get_data():
-        return https_fn.Response(
-            json.dumps({"error": "No data provided"}),
+        return json_response(
+            req,
+            {"error": "No data provided"},
             status=400,
             headers=cors_headers
         )
@@ -284,38 +678,58 @@ def check_spam_risk(req: https_fn.Request) -> https_fn.Response:
         text = data.get("text", "")
 
         if not text or not text.strip():
-            return https_fn.Response(
-                json.dumps({"error": "Text is required"}),
+            return json_response(
+                req,
+                {"error": "Text is required"},
                 status=400,
                 headers=cors_headers
             )
 
         if len(text) > 50000:
-            return https_fn.Response(
-                json.dumps({"error": "Text exceeds maximum length of 50000 characters"}),
+            return json_response(
+                req,
+                {"error": "Text exceeds maximum length of 50000 characters"},
                 status=400,
                 headers=cors_headers
             )
 
         api_key = os.environ.get("TURGENEV_API_KEY")
         if not api_key:
-            return https_fn.Response(
-                json.dumps({"error": "API key not configured"}),
+            return json_response(
+                req,
+                {"error": "API key not configured"},
                 status=500,
                 headers=cors_headers
             )
 
-        result = get_spam_risk_score(text, api_key)
+        chunked = data.get("chunked", False)
+        if not isinstance(chunked, bool):
+            return json_response(
+                req,
+                {"error": "chunked must be a boolean"},
+                status=400,
+                headers=cors_headers
+            )
 
-        return https_fn.Response(
-            json.dumps(result),
+        if chunked:
+            result = get_chunked_spam_risk_score(text, api_key)
+        else:
+            result = get_spam_risk_score(text, api_key)
+            # Fall back to chunks only when the API rejects the URL as too long
+            if result.get("statusCode") == 414:
+                result = get_chunked_spam_risk_score(text, api_key)
+
+        return json_response(
+            req,
+            result,
             status=200,
             headers=cors_headers
         )
 
     except Exception as e:
-        return https_fn.Response(
-            json.dumps({"error": str(e)}),
+        return json_response(
+            req,
+            {"error": str(e)},
             status=500,
             headers=cors_headers
         )
@@ -342,15 +756,17 @@ def save_analysis(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response("", status=204, headers=cors_headers)
 
     if req.method != "POST":
-        return https_fn.Response(
-            json.dumps({"error": "Method not allowed"}),
+        return json_response(
+            req,
+            {"error": "Method not allowed"},
             status=405,
             headers=cors_headers
         )
 
     if not req.get_data():
-        return https_fn.Response(
-            json.dumps({"error": "No data provided"}),
+        return json_response(
+            req,
+            {"error": "No data provided"},
             status=400,
             headers=cors_headers
         )
@@ -360,15 +776,17 @@ def save_analysis(req: https_fn.Request) -> https_fn.Response:
         text = data.get("text", "")
 
         if not text or not text.strip():
-            return https_fn.Response(
-                json.dumps({"error": "Text is required"}),
+            return json_response(
+                req,
+                {"error": "Text is required"},
                 status=400,
                 headers=cors_headers
             )
 
         if len(text) > 50000:
-            return https_fn.Response(
-                json.dumps({"error": "Text exceeds maximum length of 50000 characters"}),
+            return json_response(
+                req,
+                {"error": "Text exceeds maximum length of 50000 characters"},
                 status=400,
                 headers=cors_headers
             )
@@ -385,15 +803,17 @@ def save_analysis(req: https_fn.Request) -> https_fn.Response:
 
         db.collection("analyses").document(analysis_id).set(doc_data)
 
-        return https_fn.Response(
-            json.dumps({"id": analysis_id}),
+        return json_response(
+            req,
+            {"id": analysis_id},
             status=200,
             headers=cors_headers
         )
 
     except Exception as e:
-        return https_fn.Response(
-            json.dumps({"error": str(e)}),
+        return json_response(
+            req,
+            {"error": str(e)},
             status=500,
             headers=cors_headers
         )
@@ -414,8 +834,9 @@ def get_analysis(req: https_fn.Request) -> https_fn.Response:
         return https_fn.Response("", status=204, headers=cors_headers)
 
     if req.method != "GET":
-        return https_fn.Response(
-            json.dumps({"error": "Method not allowed"}),
+        return json_response(
+            req,
+            {"error": "Method not allowed"},
             status=405,
             headers=cors_headers
         )
@@ -423,15 +844,17 @@ def get_analysis(req: https_fn.Request) -> https_fn.Response:
     analysis_id = req.args.get("id")
 
     if not analysis_id:
-        return https_fn.Response(
-            json.dumps({"error": "ID parameter is required"}),
+        return json_response(
+            req,
+            {"error": "ID parameter is required"},
             status=400,
             headers=cors_headers
         )
 
     if not re.match(r'^[a-z0-9]{8}$', analysis_id):
-        return https_fn.Response(
-            json.dumps({"error": "Invalid ID format"}),
+        return json_response(
+            req,
+            {"error": "Invalid ID format"},
             status=400,
             headers=cors_headers
         )
@@ -440,8 +863,9 @@ def get_analysis(req: https_fn.Request) -> https_fn.Response:
         doc = db.collection("analyses").document(analysis_id).get()
 
         if not doc.exists:
-            return https_fn.Response(
-                json.dumps({"error": "Analysis not found"}),
+            return json_response(
+                req,
+                {"error": "Analysis not found"},
                 status=404,
                 headers=cors_headers
             )
@@ -454,15 +878,17 @@ def get_analysis(req: https_fn.Request) -> https_fn.Response:
             "spamRiskResult": doc_data.get("spamRiskResult")
         }
 
-        return https_fn.Response(
-            json.dumps(result),
+        return json_response(
+            req,
+            result,
             status=200,
             headers=cors_headers
         )
 
     except Exception as e:
-        return https_fn.Response(
-            json.dumps({"error": str(e)}),
+        return json_response(
+            req,
+            {"error": str(e)},
             status=500,
             headers=cors_headers
         )
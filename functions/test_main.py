@@ -1,8 +1,15 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import gzip
 import json
 import re
-from main import analyze_text_logic, get_spam_risk_score, generate_id, detect_overfrequent_words
+import threading
+import time
+import main
+from main import analyze_text_logic, get_spam_risk_score, generate_id, detect_overfrequent_words, compute_density_windows
+from main import json_response, negotiate_encoding, top_counts, shape_analysis_result
+from main import split_text_chunks, get_chunked_spam_risk_score, encoded_length, RateLimiter
+from loadtest import percentile, parse_mix, run_load_test, build_request, decode_body
 
 
 class TestAnalyzeTextLogic(unittest.TestCase):
@@ -131,6 +138,35 @@ class TestSpamRiskIntegration(unittest.TestCase):
         self.assertEqual(result["level"], "средний")
         mock_get.assert_called_once()
 
+    @patch('main.spam_rate_limiter')
+    @patch('main.requests.get')
+    def test_calls_go_through_rate_limiter(self, mock_get, mock_limiter):
+        """Test that every outbound call waits on the shared rate limiter."""
+        mock_get.return_value = MagicMock(status_code=200, json=lambda: {"risk": 1})
+
+        get_spam_risk_score("Test text", "test_api_key")
+        get_spam_risk_score("More text", "test_api_key")
+
+        self.assertEqual(mock_limiter.wait.call_count, 2)
+
+    def test_rate_limiter_spacing(self):
+        """Test that the limiter spaces call starts across threads."""
+        limiter = RateLimiter(50)
+        starts = []
+
+        def call():
+            limiter.wait()
+            starts.append(time.monotonic())
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        starts.sort()
+        self.assertGreaterEqual(starts[-1] - starts[0], 5 * 0.02 - 0.005)
+
     @patch('main.requests.get')
     def test_api_error_response(self, mock_get):
         """Test spam risk API error response."""
@@ -262,6 +298,391 @@ class TestZipfLaw(unittest.TestCase):
             self.assertIsInstance(keyword["isOverFrequent"], bool)
 
 
+class TestAnalyzeTextHandler(unittest.TestCase):
+    """Test request validation and response shaping in the analyze_text handler."""
+
+    def post(self, body, accept_encoding=None):
+        return main.analyze_text(build_request("POST", body=body, accept_encoding=accept_encoding))
+
+    def assert_bad_request(self, body, message):
+        response = self.post(body)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(message, decode_body(response)["error"])
+
+    def test_invalid_limit(self):
+        """Test that limit must be an integer between 1 and 1000."""
+        for limit in (0, 1001, True, "5", 2.5):
+            self.assert_bad_request({"text": "apple apple", "limit": limit}, "limit")
+
+    def test_invalid_fields(self):
+        """Test that fields must be a list of known field names."""
+        for fields in ("phrases", ["phrases", "unknown"], [1]):
+            self.assert_bad_request({"text": "apple apple", "fields": fields}, "fields")
+
+    def test_invalid_shape(self):
+        """Test that shape must be objects or columnar."""
+        for shape in ("rows", None, 1):
+            self.assert_bad_request({"text": "apple apple", "shape": shape}, "shape")
+
+    def test_gzip_columnar_response(self):
+        """Test a limited columnar response compressed with gzip."""
+        text = " ".join(f"keyword{c}alpha keyword{c}beta" for c in "abcdefghijklmnopqrstuvwxyz") + " "
+        body = {"text": text * 3, "limit": 40, "fields": ["singleKeywords", "totalWords"], "shape": "columnar"}
+        with patch.object(main, "brotli", None):
+            response = self.post(body, accept_encoding="gzip")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        result = json.loads(gzip.decompress(response.get_data()))
+        self.assertEqual(set(result), {"singleKeywords", "totalWords"})
+        self.assertEqual(len(result["singleKeywords"]["keyword"]), 40)
+        self.assertEqual(len(result["singleKeywords"]["density"]), 40)
+
+
+class TestDensityWindows(unittest.TestCase):
+    """Test sliding-window keyword density."""
+
+    def brute_force(self, stems, stem, window_size):
+        """Recount every window to compare against the rolling version."""
+        return [
+            stems[start:start + window_size].count(stem)
+            for start in range(len(stems) - window_size + 1)
+        ]
+
+    def test_matches_brute_force(self):
+        """Test that the densest window matches a full recount."""
+        stems = ["a", "b", "c", "a", "a", "d", "a", "b", "e", "f", "a", "c"] * 3
+        spans = [(i, i + 1) for i in range(len(stems))]
+        result = compute_density_windows(stems, spans, [("a", "a"), ("b", "b")], 5)
+
+        for entry, stem in zip(result["keywords"], ["a", "b"]):
+            counts = self.brute_force(stems, stem, 5)
+            self.assertAlmostEqual(entry["maxDensity"], round(max(counts) / 5 * 100, 2))
+            self.assertEqual(counts[entry["maxWindowStart"]], max(counts))
+
+    def test_stopword_stem_collision(self):
+        """Test that stopwords sharing a keyword's stem do not count in windows."""
+        text = "will will will. willing wills. " + "filler text here " * 3
+        result = analyze_text_logic(text, window_size=10)
+
+        overall = next(k for k in result["singleKeywords"] if k["keyword"] == "will")
+        window = next(k for k in result["densityWindows"]["keywords"] if k["keyword"] == "will")
+        self.assertEqual(overall["timesUsed"], 2)
+        self.assertEqual(window["maxDensity"], 20.0)
+
+    def test_samples_cover_text(self):
+        """Test that sampled windows start at zero and end at the last window."""
+        stems = ["x"] * 25
+        spans = [(i, i + 1) for i in range(25)]
+        result = compute_density_windows(stems, spans, [("x", "x")], 10)
+
+        self.assertEqual(result["windowStarts"][0], 0)
+        self.assertEqual(result["windowStarts"][-1], 15)
+        self.assertEqual(len(result["keywords"][0]["densities"]), len(result["windowStarts"]))
+        self.assertTrue(all(d == 100.0 for d in result["keywords"][0]["densities"]))
+
+    def test_window_larger_than_text(self):
+        """Test that a window longer than the text covers the whole text."""
+        stems = ["x", "y", "x", "z"]
+        spans = [(0, 1), (2, 3), (4, 5), (6, 7)]
+        result = compute_density_windows(stems, spans, [("x", "x")], 100)
+
+        self.assertEqual(result["windowSize"], 4)
+        self.assertEqual(result["keywords"][0]["maxDensity"], 50.0)
+        self.assertEqual(result["keywords"][0]["maxWindowCharEnd"], 7)
+
+    def test_local_stuffing_detected(self):
+        """Test that a stuffed paragraph shows up despite low overall density."""
+        filler = " ".join(f"{chr(97 + i // 26)}{chr(97 + i % 26)}filler" for i in range(200))
+        stuffed = "widget " * 15
+        text = filler + " " + stuffed + filler
+        result = analyze_text_logic(text, window_size=20)
+
+        widget = next(k for k in result["densityWindows"]["keywords"] if k["keyword"] == "widget")
+        overall = next(k for k in result["singleKeywords"] if k["keyword"] == "widget")
+        self.assertLess(overall["density"], 5.0)
+        self.assertGreaterEqual(widget["maxDensity"], 75.0)
+        self.assertIn("widget", text[widget["maxWindowCharStart"]:widget["maxWindowCharEnd"]])
+
+    def test_offsets_refer_to_original_text(self):
+        """Test that character offsets survive lowercasing that changes length."""
+        filler = " ".join(f"{chr(97 + i // 26)}{chr(97 + i % 26)}filler" for i in range(100))
+        text = "İİİİİİİİİİ " + filler + " widget widget widget widget"
+        result = analyze_text_logic(text, window_size=10)
+
+        widget = next(k for k in result["densityWindows"]["keywords"] if k["keyword"] == "widget")
+        window = text[widget["maxWindowCharStart"]:widget["maxWindowCharEnd"]]
+        self.assertTrue(window.endswith("widget widget widget widget"))
+        self.assertFalse(window.startswith(("s ", "ds ")))
+        self.assertEqual(len(window.split()), 10)
+
+    def test_not_included_by_default(self):
+        """Test that the window profile is only computed on request."""
+        result = analyze_text_logic("apple banana apple orange apple banana")
+        self.assertNotIn("densityWindows", result)
+
+
+class TestResponseEncoding(unittest.TestCase):
+    """Test JSON serialization and compression negotiation."""
+
+    def make_request(self, accept_encoding=None):
+        req = MagicMock()
+        req.headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+        return req
+
+    def test_negotiate_encoding(self):
+        """Test Accept-Encoding parsing with quality values."""
+        self.assertIsNone(negotiate_encoding(None))
+        self.assertIsNone(negotiate_encoding("identity"))
+        self.assertEqual(negotiate_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(negotiate_encoding("gzip;q=0"))
+        with patch.object(main, "brotli", MagicMock()):
+            self.assertEqual(negotiate_encoding("gzip, br"), "br")
+            self.assertEqual(negotiate_encoding("gzip;q=1.0, br;q=0.5"), "gzip")
+        with patch.object(main, "brotli", None):
+            self.assertEqual(negotiate_encoding("br, gzip;q=0.5"), "gzip")
+            self.assertIsNone(negotiate_encoding("br"))
+
+    def test_gzip_response(self):
+        """Test that large payloads are gzipped when accepted."""
+        payload = {"phrases": [{"phrase": "machine learning", "timesUsed": i} for i in range(200)]}
+        with patch.object(main, "brotli", None):
+            response = json_response(self.make_request("gzip"), payload, status=200, headers={})
+
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(json.loads(gzip.decompress(response.get_data())), payload)
+
+    def test_small_response_not_compressed(self):
+        """Test that small payloads are sent as plain JSON."""
+        response = json_response(self.make_request("gzip"), {"error": "Text is required"}, status=400, headers={})
+
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.get_data()), {"error": "Text is required"})
+
+    def test_stdlib_fallback(self):
+        """Test serialization without orjson installed."""
+        with patch.object(main, "orjson", None):
+            response = json_response(self.make_request(), {"level": "средний"}, status=200, headers={})
+
+        self.assertEqual(json.loads(response.get_data()), {"level": "средний"})
+
+
+class TestResultShaping(unittest.TestCase):
+    """Test result limits, field selection and columnar shape."""
+
+    def test_top_counts_matches_full_sort(self):
+        """Test that partial selection returns the head of the full sort."""
+        counts = [("w%d" % i, (i * 7) % 13) for i in range(100)]
+        full = top_counts(counts)
+
+        self.assertEqual(top_counts(counts, 10), full[:10])
+        self.assertEqual(top_counts(counts, 500), full)
+
+    def test_limit(self):
+        """Test that limit caps every result list."""
+        text = " ".join(f"alpha{c} beta{c} alpha{c} beta{c}" for c in "abcdefghij")
+        full = analyze_text_logic(text)
+        limited = analyze_text_logic(text, limit=3)
+
+        self.assertEqual(limited["singleKeywords"], full["singleKeywords"][:3])
+        self.assertEqual(limited["phrases"], full["phrases"][:3])
+        self.assertEqual(limited["totalWords"], full["totalWords"])
+
+    def test_columnar_density_windows(self):
+        """Test that density window keywords are converted to parallel arrays."""
+        text = "machine learning is great machine learning rocks " * 5
+        result = analyze_text_logic(text, window_size=10)
+        shaped = shape_analysis_result(result, shape="columnar")
+
+        keywords = result["densityWindows"]["keywords"]
+        columns = shaped["densityWindows"]["keywords"]
+        self.assertEqual(columns["keyword"], [k["keyword"] for k in keywords])
+        self.assertEqual(columns["densities"], [k["densities"] for k in keywords])
+        self.assertEqual(columns["maxWindowCharEnd"], [k["maxWindowCharEnd"] for k in keywords])
+        self.assertEqual(shaped["densityWindows"]["windowStarts"], result["densityWindows"]["windowStarts"])
+        self.assertIsInstance(result["densityWindows"]["keywords"], list)
+
+    def test_limit_does_not_cap_density_windows(self):
+        """Test that the window profile keeps the top keywords regardless of limit."""
+        text = " ".join(f"alpha{c} beta{c} alpha{c} beta{c}" for c in "abcdefghijkl")
+        result = analyze_text_logic(text, window_size=10, limit=1)
+
+        self.assertEqual(len(result["singleKeywords"]), 1)
+        self.assertEqual(len(result["densityWindows"]["keywords"]), 10)
+
+    def test_fields(self):
+        """Test that only requested fields are returned."""
+        result = analyze_text_logic("apple banana apple orange apple banana")
+        shaped = shape_analysis_result(result, fields=["singleKeywords", "totalWords"])
+
+        self.assertEqual(set(shaped), {"singleKeywords", "totalWords"})
+
+    def test_columnar(self):
+        """Test conversion of object lists into parallel arrays."""
+        result = analyze_text_logic("machine learning is great machine learning rocks")
+        shaped = shape_analysis_result(result, shape="columnar")
+
+        keywords = shaped["singleKeywords"]
+        self.assertEqual(keywords["keyword"], [k["keyword"] for k in result["singleKeywords"]])
+        self.assertEqual(keywords["density"], [k["density"] for k in result["singleKeywords"]])
+        self.assertEqual(shaped["phrases"]["phrase"], [p["phrase"] for p in result["phrases"]])
+        self.assertEqual(shaped["stopwords"], {"keyword": [], "density": [], "timesUsed": [], "isStopword": [], "isOverFrequent": []})
+
+
+class TestChunkedSpamRisk(unittest.TestCase):
+    """Test chunked spam scoring for long texts."""
+
+    def test_chunks_within_limit(self):
+        """Test that chunks cover the text and stay under the encoded limit."""
+        text = "\n\n".join(
+            " ".join(f"Сентенция номер {i} про таблицы и pdf." for i in range(p * 7, p * 7 + 7))
+            for p in range(40)
+        )
+        spans = split_text_chunks(text, 600)
+
+        self.assertGreater(len(spans), 1)
+        self.assertEqual("".join(text[start:end] for start, end in spans), text)
+        for start, end in spans:
+            self.assertLessEqual(encoded_length(text[start:end]), 600)
+
+    def test_chunks_cut_at_sentence_boundaries(self):
+        """Test that cuts fall after sentence punctuation when possible."""
+        text = " ".join(f"Sentence {i} is here." for i in range(200))
+        spans = split_text_chunks(text, 300)
+
+        for start, end in spans[:-1]:
+            self.assertTrue(text[start:end].rstrip().endswith("."))
+
+    def test_long_word_hard_cut(self):
+        """Test that text without boundaries is still split."""
+        text = "x" * 1000
+        spans = split_text_chunks(text, 300)
+
+        self.assertEqual([end - start for start, end in spans], [300, 300, 300, 100])
+
+    def post(self, body):
+        with patch.dict("os.environ", {"TURGENEV_API_KEY": "test_api_key"}):
+            response = main.check_spam_risk(build_request("POST", body=body))
+        return decode_body(response)
+
+    @patch('main.get_chunked_spam_risk_score')
+    @patch('main.get_spam_risk_score')
+    def test_not_chunked_by_default(self, mock_score, mock_chunked):
+        """Test that long texts are scored in a single call unless chunked is set."""
+        mock_score.return_value = {"success": True, "risk": 4, "level": "", "details": [], "link": ""}
+        result = self.post({"text": "Sentence here. " * 2000})
+
+        self.assertEqual(result["risk"], 4)
+        mock_score.assert_called_once()
+        mock_chunked.assert_not_called()
+
+    @patch('main.get_chunked_spam_risk_score')
+    @patch('main.get_spam_risk_score')
+    def test_chunked_on_request(self, mock_score, mock_chunked):
+        """Test that chunked mode skips the single call."""
+        mock_chunked.return_value = {"success": True, "risk": 5, "level": "", "details": [], "link": ""}
+        result = self.post({"text": "Sentence here.", "chunked": True})
+
+        self.assertEqual(result["risk"], 5)
+        mock_score.assert_not_called()
+
+    @patch('main.get_chunked_spam_risk_score')
+    @patch('main.get_spam_risk_score')
+    def test_falls_back_on_uri_too_long(self, mock_score, mock_chunked):
+        """Test fallback to chunks only when the single call gets a 414."""
+        mock_score.return_value = {"success": False, "error": "API returned status code 414: ", "statusCode": 414}
+        mock_chunked.return_value = {"success": True, "risk": 5, "level": "", "details": [], "link": ""}
+        self.assertEqual(self.post({"text": "Sentence here."})["risk"], 5)
+
+        mock_chunked.reset_mock()
+        mock_score.return_value = {"success": False, "error": "API returned status code 500: ", "statusCode": 500}
+        self.assertFalse(self.post({"text": "Sentence here."})["success"])
+        mock_chunked.assert_not_called()
+
+    @patch('main.get_spam_risk_score')
+    def test_combines_worst_chunk(self, mock_score):
+        """Test that the combined risk comes from the riskiest chunk."""
+        def score(text, api_key):
+            risk = 9 if "stuffing" in text else 2
+            return {"success": True, "risk": risk, "level": str(risk), "details": [text[:5]], "link": ""}
+        mock_score.side_effect = score
+
+        text = "Normal sentence here. " * 400 + "stuffing stuffing stuffing. " * 10 + "Normal sentence here. " * 400
+        result = get_chunked_spam_risk_score(text, "test_api_key")
+
+        self.assertTrue(result["success"])
+        self.assertFalse(result["partial"])
+        self.assertEqual(result["risk"], 9)
+        self.assertGreater(len(result["chunks"]), 2)
+        worst = [c for c in result["chunks"] if c["risk"] == 9]
+        self.assertEqual(len(worst), 1)
+        self.assertEqual(result["worstChunk"], worst[0]["index"])
+        self.assertEqual(result["details"], worst[0]["details"])
+        self.assertIn("stuffing", text[worst[0]["start"]:worst[0]["end"]])
+        for chunk in result["chunks"]:
+            self.assertEqual(chunk["details"], [text[chunk["start"]:chunk["start"] + 5]])
+            self.assertIn("link", chunk)
+
+    @patch('main.get_spam_risk_score')
+    def test_partial_and_total_failure(self, mock_score):
+        """Test reporting when some or all chunks fail."""
+        text = "Sentence here. " * 1000
+        mock_score.side_effect = lambda chunk, key: {"success": False, "error": "boom"}
+        result = get_chunked_spam_risk_score(text, "test_api_key")
+        self.assertFalse(result["success"])
+        self.assertEqual(result["error"], "boom")
+
+        calls = []
+
+        def flaky(chunk, key):
+            calls.append(chunk)
+            if len(calls) == 1:
+                return {"success": False, "error": "boom"}
+            return {"success": True, "risk": 1, "level": "", "details": [], "link": ""}
+        mock_score.side_effect = flaky
+        result = get_chunked_spam_risk_score(text, "test_api_key")
+        self.assertTrue(result["success"])
+        self.assertTrue(result["partial"])
+
+
+class TestLoadTest(unittest.TestCase):
+    """Test the load-test harness and its local stand-ins."""
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 95), 7)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_parse_mix(self):
+        """Test request mix parsing."""
+        self.assertEqual(parse_mix("analyze_text=3,get_analysis=1"), {"analyze_text": 3.0, "get_analysis": 1.0})
+        with self.assertRaises(ValueError):
+            parse_mix("unknown=1")
+
+    def test_small_run(self):
+        """Test a short run across all endpoints with injected spam API errors."""
+        report = run_load_test(
+            "machine learning is great machine learning rocks",
+            total_requests=40,
+            concurrency=4,
+            spam_latency_ms=1,
+            spam_jitter_ms=0,
+            spam_error_rate=1.0,
+            seed=1
+        )
+
+        self.assertEqual(report["totals"]["requests"], 40)
+        self.assertEqual(report["endpoints"]["check_spam_risk"]["errorRate"], 1.0)
+        for name in ("analyze_text", "save_analysis", "get_analysis"):
+            self.assertEqual(report["endpoints"][name]["errors"], 0)
+            self.assertIn("p99", report["endpoints"][name]["latencyMs"])
+
+
 if __name__ == "__main__":
     unittest.main()
 